@@ -1,28 +1,108 @@
 import os
+import atexit
 import json
+import hashlib
+import functools
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from azure.ai.projects import AIProjectClient
 from azure.identity import DefaultAzureCredential
 from azure.ai.agents.models import OpenApiTool, OpenApiAnonymousAuthDetails, McpTool
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+@dataclass(frozen=True)
+class Config:
+    """Setup configuration, read and validated once from environment variables"""
+    __slots__ = (
+        "project_endpoint", "model_deployment_name", "webapp_url",
+        "external_inventory_url", "mcp_url", "force_recreate"
+    )
+    
+    project_endpoint: str
+    model_deployment_name: str
+    webapp_url: str
+    external_inventory_url: str
+    mcp_url: str
+    force_recreate: bool
+    
+    @classmethod
+    def from_env(cls):
+        """Build the configuration from environment variables"""
+        external_inventory_url = os.environ.get("EXTERNAL_INVENTORY_URL")
+        
+        if not external_inventory_url:
+            raise RuntimeError(
+                "EXTERNAL_INVENTORY_URL environment variable not set! "
+                "Please set it to point to your external inventory service, for example: "
+                "export EXTERNAL_INVENTORY_URL='https://your-inventory-server.com'"
+            )
+        
+        # The MCP endpoint lives under /mcp on the external inventory service
+        base_url = external_inventory_url.rstrip('/')
+        mcp_url = f"{base_url}/mcp" if not base_url.endswith('/mcp') else base_url
+        
+        return cls(
+            project_endpoint=os.environ["PROJECT_ENDPOINT"],
+            model_deployment_name=os.environ["MODEL_DEPLOYMENT_NAME"],
+            webapp_url=os.environ["WEBAPP_URL"],
+            external_inventory_url=external_inventory_url,
+            mcp_url=mcp_url,
+            # Opt out of reusing unchanged agents and delete everything, as a clean setup
+            force_recreate=os.environ.get("FORCE_RECREATE_AGENTS", "").lower() in ("1", "true", "yes"),
+        )
+
 # Configuration from environment variables
-project_endpoint = os.environ["PROJECT_ENDPOINT"]
-model_deployment_name = os.environ["MODEL_DEPLOYMENT_NAME"]
-webapp_url = os.environ["WEBAPP_URL"]
-external_inventory_api_url = os.environ["EXTERNAL_INVENTORY_URL"]
+config = Config.from_env()
+
+# Upper bound on concurrent Azure AI Foundry requests during setup
+MAX_CONCURRENT_REQUESTS = 8
+
+# Agent metadata keys used to recognise unchanged agents on re-runs
+AGENT_KEY_METADATA = "agent_key"
+FINGERPRINT_METADATA = "definition_hash"
+
+@functools.lru_cache(maxsize=1)
+def _get_credential():
+    """Build the Azure credential once per process so its token cache is reused"""
+    credential = DefaultAzureCredential()
+    atexit.register(credential.close)
+    return credential
+
+@functools.lru_cache(maxsize=4)
+def _get_project_client(endpoint):
+    """Build one AIProjectClient per endpoint and share it across setup runs"""
+    project_client = AIProjectClient(
+        endpoint=endpoint,
+        credential=_get_credential(),
+    )
+    atexit.register(project_client.close)
+    return project_client
+
+@functools.lru_cache(maxsize=4)
+def _read_swagger_spec(path, mtime):
+    """Read and parse a swagger file, cached per (path, mtime) so edits are picked up"""
+    if orjson is not None:
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers handle both
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    
+    with open(path, 'r') as f:
+        return json.load(f)
 
 def load_and_patch_swagger_spec(webapp_url):
     """Load swagger.json and patch the server URL with the webapp URL"""
     try:
-        # Load the swagger.json file
-        with open('swagger.json', 'r') as f:
-            swagger_spec = json.load(f)
-        
-        # Patch the server URL
-        if 'servers' not in swagger_spec:
-            swagger_spec['servers'] = []
+        # Load the swagger.json file (parsed once per file version)
+        swagger_path = os.path.abspath('swagger.json')
+        cached_spec = _read_swagger_spec(swagger_path, os.path.getmtime(swagger_path))
         
-        # Replace or add the server URL
-        swagger_spec['servers'] = [{"url": webapp_url}]
+        # Replace or add the server URL. Only the top-level 'servers' key changes, so a
+        # shallow copy is enough to keep the cached spec unmodified
+        swagger_spec = {**cached_spec, "servers": [{"url": webapp_url}]}
         
         print(f"✓ Loaded and patched swagger.json with server URL: {webapp_url}")
         return swagger_spec
@@ -34,32 +114,8 @@ def load_and_patch_swagger_spec(webapp_url):
         print(f"✗ Error parsing swagger.json: {e}")
         raise
 
-# Fashion assistant agents to create
-def get_agents_config(webapp_url, external_mcp_server_url):
-    """Get agent configurations with tools"""
-    
-    # Load and patch the swagger spec for the cart agent
-    cart_openapi_spec = load_and_patch_swagger_spec(webapp_url)
-    
-    # Create OpenAPI tool for cart management
-    cart_auth = OpenApiAnonymousAuthDetails()
-    cart_openapi_tool = OpenApiTool(
-        name="cart_manager",
-        spec=cart_openapi_spec,
-        description="Manages shopping cart operations including add, remove, view, and clear cart",
-        auth=cart_auth
-    )
-    
-    # Create MCP tool for inventory management using external MCP server
-    mcp_tool = McpTool(
-        server_label="inventory_mcp",
-        server_url=external_mcp_server_url
-    )
-    
-    return {
-        "main_orchestrator": {
-            "name": "Fashion Store Main Agent",
-            "instructions": """You are the main orchestrator for a fashion retail store. You coordinate between your 3 specialist agents and handle inventory queries directly via MCP tools.
+# Agent instructions, defined once per process and fingerprinted to detect changes
+_MAIN_INSTRUCTIONS = """You are the main orchestrator for a fashion retail store. You coordinate between your 3 specialist agents and handle inventory queries directly via MCP tools.
 
 Your specialist agents:
 1. **Cart Manager**: Handles all shopping cart operations (add/remove items, view cart, clear cart)
@@ -122,13 +178,9 @@ Example inventory search workflow:
 5. You: Present ALL relevant matches found, such as "Red Slim Fit Checked Casual Shirt" and any other red shirt variants
 6. You: Provide details about available sizes and prices for each option
 
-Always verify product availability yourself before allowing cart operations.""",
-            "mcp_tool": mcp_tool  # Store the MCP tool object for agent creation
-        },
-        
-        "cart_manager": {
-            "name": "Cart Manager",
-            "instructions": """You are the Cart Manager for a fashion retail store. You handle all shopping cart operations using OpenAPI tools.
+Always verify product availability yourself before allowing cart operations."""
+
+_CART_INSTRUCTIONS = """You are the Cart Manager for a fashion retail store. You handle all shopping cart operations using OpenAPI tools.
 
 CRITICAL INSTRUCTIONS:
 - The main orchestrator will provide you with EXACT product details including productId
@@ -155,13 +207,9 @@ Example workflow:
 IMPORTANT: If you receive vague product descriptions without specific productId, respond with:
 "I need the exact productId to add this item to the cart. Could you please use your inventory tools to find the specific product ID first?"
 
-Always provide clear confirmation of cart operations and current cart status.""",
-            "tools": cart_openapi_tool.definitions
-        },
-        
-        "fashion_advisor": {
-            "name": "Fashion Advisor Agent",
-            "instructions": """You are an expert fashion consultant providing style advice and recommendations.
+Always provide clear confirmation of cart operations and current cart status."""
+
+_FASHION_INSTRUCTIONS = """You are an expert fashion consultant providing style advice and recommendations.
 
 Your expertise includes:
 - Style suggestions based on customer preferences and body type
@@ -173,13 +221,9 @@ Your expertise includes:
 
 Work with the main agent who has access to current inventory to suggest available products that match customer style preferences.
 Always consider the customer's needs, preferences, budget, and lifestyle when making recommendations.
-Provide specific, actionable advice and be encouraging about personal style exploration.""",
-            "tools": []
-        },
-        
-        "content_moderator": {
-            "name": "Content Moderator Agent",
-            "instructions": """You are responsible for maintaining a safe, respectful, and professional environment in all customer interactions for a fashion retail store.
+Provide specific, actionable advice and be encouraging about personal style exploration."""
+
+_MODERATOR_INSTRUCTIONS = """You are responsible for maintaining a safe, respectful, and professional environment in all customer interactions for a fashion retail store.
 
 Your primary responsibilities:
 1. **Topic Relevance**: Ensure all requests are appropriate for a fashion retail environment
@@ -213,42 +257,96 @@ Examples:
 - "help me find a dress for a wedding" → APPROVED: This request is appropriate for our fashion retail environment.
 - "add jeans to my cart" → APPROVED: This request is appropriate for our fashion retail environment.
 
-Always prioritize customer safety while maintaining focus on fashion retail assistance.""",
+Always prioritize customer safety while maintaining focus on fashion retail assistance."""
+
+def _agent_fingerprint(model, name, instructions, tools):
+    """Hash everything that defines an agent so unchanged agents can be reused across runs"""
+    payload = json.dumps(
+        {"model": model, "name": name, "instructions": instructions, "tools": tools},
+        sort_keys=True,
+        default=dict  # SDK tool definitions are mappings
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+# Fashion assistant agents to create
+def get_agents_config(webapp_url, external_mcp_server_url):
+    """Get agent configurations with tools"""
+    
+    # Load and patch the swagger spec for the cart agent
+    cart_openapi_spec = load_and_patch_swagger_spec(webapp_url)
+    
+    # Create OpenAPI tool for cart management
+    cart_auth = OpenApiAnonymousAuthDetails()
+    cart_openapi_tool = OpenApiTool(
+        name="cart_manager",
+        spec=cart_openapi_spec,
+        description="Manages shopping cart operations including add, remove, view, and clear cart",
+        auth=cart_auth
+    )
+    
+    # Create MCP tool for inventory management using external MCP server
+    mcp_tool = McpTool(
+        server_label="inventory_mcp",
+        server_url=external_mcp_server_url
+    )
+    
+    # Resolve tool definitions once; the SDK may rebuild them on every property access
+    cart_defs = cart_openapi_tool.definitions
+    mcp_defs = mcp_tool.definitions
+    
+    return {
+        "main_orchestrator": {
+            "name": "Fashion Store Main Agent",
+            "instructions": _MAIN_INSTRUCTIONS,
+            "tools": mcp_defs  # MCP tool definitions, combined with connected agents at creation
+        },
+        
+        "cart_manager": {
+            "name": "Cart Manager",
+            "instructions": _CART_INSTRUCTIONS,
+            "tools": cart_defs
+        },
+        
+        "fashion_advisor": {
+            "name": "Fashion Advisor Agent",
+            "instructions": _FASHION_INSTRUCTIONS,
+            "tools": []
+        },
+        
+        "content_moderator": {
+            "name": "Content Moderator Agent",
+            "instructions": _MODERATOR_INSTRUCTIONS,
             "tools": []
         }
     }
 
-def create_agents():
+def create_agents(cfg=config):
     """Create fashion assistant agents in Azure AI Foundry using Connected Agents pattern"""
-    print(f"Connecting to project: {project_endpoint}")
-    print(f"Using model: {model_deployment_name}")
-    print(f"Web app URL: {webapp_url}")
-    
-    external_inventory_url = os.environ.get("EXTERNAL_INVENTORY_URL")
+    print(f"Connecting to project: {cfg.project_endpoint}")
+    print(f"Using model: {cfg.model_deployment_name}")
+    print(f"Web app URL: {cfg.webapp_url}")
+    print(f"External inventory URL: {cfg.external_inventory_url}")
+    print(f"External MCP server URL: {cfg.mcp_url}")
     
-    if not external_inventory_url:
-        print("ERROR: EXTERNAL_INVENTORY_URL environment variable not set!")
-        print("Please set it to point to your external inventory service, for example:")
-        print("  export EXTERNAL_INVENTORY_URL='https://your-inventory-server.com'")
-        return
+    if cfg.force_recreate:
+        print("FORCE_RECREATE_AGENTS is set: all existing agents will be deleted and recreated")
     
-    base_url = external_inventory_url.rstrip('/')
-    external_mcp_server_url = f"{base_url}/mcp" if not base_url.endswith('/mcp') else base_url
-    
-    print(f"External inventory URL: {external_inventory_url}")
-    print(f"External MCP server URL: {external_mcp_server_url}")
-    
-    project_client = AIProjectClient(
-        endpoint=project_endpoint,
-        credential=DefaultAzureCredential(),
-    )
+    project_client = _get_project_client(cfg.project_endpoint)
     
     agents_client = project_client.agents
     agent_ids = {}
     created_agents = {}
     
+    # Get agent configurations with external MCP server
+    agents_config = get_agents_config(cfg.webapp_url, cfg.mcp_url)
+    
+    # Specialist agents are connected to the main agent, so they are created first
+    specialist_agents = ["cart_manager", "fashion_advisor", "content_moderator"]
+    reused_agents = {}
+    main_agent_candidate = None
+    
     print(f"\n{'='*60}")
-    print("STEP 0: Cleaning up existing agents...")
+    print("STEP 0: Checking existing agents and cleaning up outdated ones...")
     print(f"{'='*60}")
     
     try:
@@ -257,50 +355,112 @@ def create_agents():
         
         for agent in existing_agents_pageable:
             existing_agents.append(agent)
-        
-        if existing_agents:
-            print(f"Found {len(existing_agents)} existing agents to delete...")
-            
-            for agent in existing_agents:
-                try:
-                    print(f"Deleting agent: {agent.name} (ID: {agent.id})")
-                    agents_client.delete_agent(agent.id)
-                    print(f"✓ Deleted agent: {agent.name}")
-                except Exception as e:
-                    print(f"✗ Failed to delete agent {agent.name}: {str(e)}")
-            
-            print(f"✓ Completed cleanup of existing agents")
-        else:
-            print("No existing agents found to delete")
             
     except Exception as e:
+        existing_agents = []
         print(f"Warning: Could not retrieve existing agents for cleanup: {str(e)}")
         print("Continuing with agent creation...")
     
-    # Get agent configurations with external MCP server
-    agents_config = get_agents_config(webapp_url, external_mcp_server_url)
+    # Keep specialists whose definition is unchanged since they were created. The main
+    # orchestrator also depends on the specialist IDs, so it is checked in Step 2.
+    # Only the metadata tag is compared, so agents edited in the portal are not detected
+    fingerprints = {
+        agent_key: _agent_fingerprint(
+            cfg.model_deployment_name,
+            agents_config[agent_key]['name'],
+            agents_config[agent_key]['instructions'],
+            agents_config[agent_key]['tools']
+        )
+        for agent_key in specialist_agents
+    }
+    stale_agents = []
     
-    # Step 1: Create specialist agents first (these will be connected to the main agent)
-    specialist_agents = ["cart_manager", "fashion_advisor", "content_moderator"]
+    for agent in existing_agents:
+        metadata = agent.metadata or {}
+        agent_key = metadata.get(AGENT_KEY_METADATA)
+        
+        if cfg.force_recreate:
+            stale_agents.append(agent)
+        elif agent_key in fingerprints and agent_key not in reused_agents \
+                and metadata.get(FINGERPRINT_METADATA) == fingerprints[agent_key]:
+            reused_agents[agent_key] = agent
+            print(f"✓ Keeping unchanged agent: {agent.name} (ID: {agent.id})")
+        elif agent_key == "main_orchestrator" and main_agent_candidate is None:
+            main_agent_candidate = agent
+        else:
+            stale_agents.append(agent)
+    
+    # A recreated specialist gets a new ID, so the old main orchestrator's connected tools
+    # would point at a deleted agent. Remove it now rather than leaving it live if Step 1 fails
+    if main_agent_candidate is not None and len(reused_agents) < len(specialist_agents):
+        stale_agents.append(main_agent_candidate)
+        main_agent_candidate = None
     
+    if stale_agents:
+        print(f"Found {len(stale_agents)} existing agents to delete...")
+        
+        # Deletes are independent network round-trips, so issue them concurrently
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+            futures = {}
+            
+            for agent in stale_agents:
+                print(f"Deleting agent: {agent.name} (ID: {agent.id})")
+                futures[agent.id] = executor.submit(agents_client.delete_agent, agent.id)
+        
+        # Report results in listing order regardless of completion order
+        for agent in stale_agents:
+            try:
+                futures[agent.id].result()
+                print(f"✓ Deleted agent: {agent.name}")
+            except Exception as e:
+                print(f"✗ Failed to delete agent {agent.name}: {str(e)}")
+        
+        print(f"✓ Completed cleanup of existing agents")
+    else:
+        print("No outdated agents found to delete")
+    
+    # Step 1: Create specialist agents first (these will be connected to the main agent)
     print(f"\n{'='*60}")
-    print("STEP 1: Creating specialist agents...")
+    print("STEP 1: Creating or reusing specialist agents...")
     print(f"{'='*60}")
     
+    def create_specialist_agent(agent_key):
+        agent_config = agents_config[agent_key]
+        
+        # Create the specialist agent, tagged so unchanged agents can be reused next run
+        return agents_client.create_agent(
+            model=cfg.model_deployment_name,
+            name=agent_config['name'],
+            instructions=agent_config['instructions'],
+            tools=agent_config['tools'],
+            metadata={
+                AGENT_KEY_METADATA: agent_key,
+                FINGERPRINT_METADATA: fingerprints[agent_key]
+            }
+        )
+    
+    created_agents.update(reused_agents)
+    
+    # Specialists don't depend on each other, so create them concurrently
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        futures = {}
+        
+        for agent_key in specialist_agents:
+            if agent_key not in reused_agents:
+                print(f"\nCreating specialist agent: {agents_config[agent_key]['name']}")
+                futures[agent_key] = executor.submit(create_specialist_agent, agent_key)
+    
+    # Report results in specialist order regardless of completion order
     for agent_key in specialist_agents:
         agent_config = agents_config[agent_key]
-        print(f"\nCreating specialist agent: {agent_config['name']}")
+        
+        if agent_key in reused_agents:
+            print(f"✓ Reusing specialist agent '{agent_config['name']}' with ID: {reused_agents[agent_key].id}")
+            continue
         
         try:
-            # Create the specialist agent
-            agent = agents_client.create_agent(
-                model=model_deployment_name,
-                name=agent_config['name'],
-                instructions=agent_config['instructions'],
-                tools=agent_config['tools']
-            )
-            
-            agent_ids[agent_key] = agent.id
+            future = futures[agent_key]
+            agent = future.result()
             created_agents[agent_key] = agent
             print(f"✓ Created specialist agent '{agent_config['name']}' with ID: {agent.id}")
             
@@ -308,9 +468,13 @@ def create_agents():
             print(f"✗ Failed to create specialist agent '{agent_config['name']}': {str(e)}")
             raise
     
+    # Record IDs in the original specialist order regardless of completion order
+    for agent_key in specialist_agents:
+        agent_ids[agent_key] = created_agents[agent_key].id
+    
     # Step 2: Create the main orchestrator agent with MCP tools and connected agent tools
     print(f"\n{'='*60}")
-    print("STEP 2: Creating main orchestrator with MCP and connected agents...")
+    print("STEP 2: Creating or reusing main orchestrator with MCP and connected agents...")
     print(f"{'='*60}")
     
     try:
@@ -350,23 +514,47 @@ def create_agents():
         
         # Get main agent config
         main_agent_config = agents_config['main_orchestrator']
-        mcp_tool = main_agent_config['mcp_tool']
+        mcp_defs = main_agent_config['tools']
         
         # Combine MCP tool definitions with connected agent tools
-        all_tools = mcp_tool.definitions + connected_agent_tools
-        
-        print(f"\nCreating main orchestrator: {main_agent_config['name']}")
-        print(f"✓ Will include MCP tools for inventory and {len(connected_agent_tools)} connected agent tools")
+        all_tools = mcp_defs + connected_agent_tools
         
-        main_agent = agents_client.create_agent(
-            model=model_deployment_name,
-            name=main_agent_config['name'],
-            instructions=main_agent_config['instructions'],
-            tools=all_tools  # Combined MCP + connected agent tools
+        main_fingerprint = _agent_fingerprint(
+            cfg.model_deployment_name,
+            main_agent_config['name'],
+            main_agent_config['instructions'],
+            all_tools
         )
         
+        if main_agent_candidate is not None \
+                and (main_agent_candidate.metadata or {}).get(FINGERPRINT_METADATA) == main_fingerprint:
+            main_agent = main_agent_candidate
+            print(f"✓ Reusing main orchestrator '{main_agent.name}' with ID: {main_agent.id}")
+        else:
+            if main_agent_candidate is not None:
+                try:
+                    print(f"Deleting outdated main orchestrator: {main_agent_candidate.name} (ID: {main_agent_candidate.id})")
+                    agents_client.delete_agent(main_agent_candidate.id)
+                    print(f"✓ Deleted agent: {main_agent_candidate.name}")
+                except Exception as e:
+                    print(f"✗ Failed to delete agent {main_agent_candidate.name}: {str(e)}")
+            
+            print(f"\nCreating main orchestrator: {main_agent_config['name']}")
+            print(f"✓ Will include MCP tools for inventory and {len(connected_agent_tools)} connected agent tools")
+            
+            main_agent = agents_client.create_agent(
+                model=cfg.model_deployment_name,
+                name=main_agent_config['name'],
+                instructions=main_agent_config['instructions'],
+                tools=all_tools,  # Combined MCP + connected agent tools
+                metadata={
+                    AGENT_KEY_METADATA: "main_orchestrator",
+                    FINGERPRINT_METADATA: main_fingerprint
+                }
+            )
+            print(f"✓ Created main orchestrator '{main_agent_config['name']}' with ID: {main_agent.id}")
+        
         agent_ids['main_orchestrator'] = main_agent.id
-        print(f"✓ Created main orchestrator '{main_agent_config['name']}' with ID: {main_agent.id}")
         print(f"✓ Main agent has MCP tools for inventory and connected to {len(specialist_agents)} specialist agents")
         
     except Exception as e:
@@ -376,9 +564,9 @@ def create_agents():
     
     # Output the agent IDs for use in the application
     print(f"\n{'='*60}")
-    print("FASHION STORE AGENT CREATION COMPLETED")
+    print("FASHION STORE AGENT SETUP COMPLETED")
     print(f"{'='*60}")
-    print("\nAgent IDs created:")
+    print("\nAgent IDs (created or reused):")
     print(f"  Main Orchestrator (with MCP): {agent_ids['main_orchestrator']}")
     print(f"  Cart Manager: {agent_ids['cart_manager']}")
     print(f"  Fashion Advisor: {agent_ids['fashion_advisor']}")
@@ -392,7 +580,7 @@ def create_agents():
     print(f"  • Cart Manager handles shopping cart via OpenAPI tools")
     print(f"  • Fashion Advisor gives style and fashion recommendations")
     print(f"  • Content Moderator ensures safe, professional interactions")
-    print(f"\nAll agents use model: {model_deployment_name}")
+    print(f"\nAll agents use model: {cfg.model_deployment_name}")
 
     return agent_ids
 